@@ -7,6 +7,34 @@ AlertIcon, VStack } from "@chakra-ui/react";
 import { FaTimes, FaCheck } from 'react-icons/fa';
 import axios from 'axios';
 
+// After a write the server returns a deadline until which this client's reads should go to the
+// primary database (so it sees its own changes). The cookie carrying it is not sent cross-origin,
+// so the header is kept here and sent back on every request until it expires.
+const READ_PRIMARY_HEADER = 'x-read-primary-until';
+let readPrimaryUntil = null;
+
+axios.interceptors.request.use(config => {
+  if (readPrimaryUntil && parseFloat(readPrimaryUntil) * 1000 > Date.now()) {
+    config.headers[READ_PRIMARY_HEADER] = readPrimaryUntil;
+  }
+  return config;
+});
+
+const rememberReadPrimary = response => {
+  const until = response && response.headers && response.headers[READ_PRIMARY_HEADER];
+  if (until) {
+    readPrimaryUntil = until;
+  }
+};
+
+axios.interceptors.response.use(response => {
+  rememberReadPrimary(response);
+  return response;
+}, error => {
+  rememberReadPrimary(error.response);
+  return Promise.reject(error);
+});
+
 // defines app component, creates paths to different components with app.js once a button is clicked or an action is done
 function App() {
   return (
@@ -156,23 +184,38 @@ const ViewCustomerDetails = () => {
   const navigate = useNavigate(); 
   const [searchInput, setSearchInput] = useState(''); // State to hold input value for customer ID search
   const [errorMessage, setErrorMessage] = useState(''); // State to hold error message if search fails
-  const [customerDetails, setCustomerDetails] = useState(null); // State to hold customer details from backend
-  const [searched, setSearched] = useState(false); // State to track if search has been performed
+  const [customerDetails, setCustomerDetails] = useState(null); // State to hold customer profile and rental counts from backend
+  const [rentals, setRentals] = useState([]); // State to hold the rental history pages loaded so far
+  const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page of rental history
 
   // Function to handle customer search
   const handleSearch = () => {
     axios.get(`http://localhost:5000/viewCustomerDetails/${searchInput}`)
       .then(response => {
-        const customer = response.data.customer;
-        setCustomerDetails(customer); 
+        setCustomerDetails(response.data.customer);
+        setRentals(response.data.rentals);
+        setNextCursor(response.data.next_cursor);
         setErrorMessage(''); // Clear error message
-        setSearched(true); 
       })
       .catch(error => {
         setCustomerDetails(null); 
+        setRentals([]);
+        setNextCursor(null);
         setErrorMessage('Error searching for customer.');
         console.error('Error searching for customer:', error); 
-        setSearched(true);
+      });
+  };
+
+  // Load the next page of the customer's rental history
+  const loadMoreRentals = () => {
+    axios.get(`http://localhost:5000/viewCustomerDetails/${customerDetails.customer_id}/rentals`, { params: { before: nextCursor } })
+      .then(response => {
+        setRentals(rentals.concat(response.data.rentals));
+        setNextCursor(response.data.next_cursor);
+      })
+      .catch(error => {
+        setErrorMessage('Error loading rental history.');
+        console.error('Error loading rental history:', error);
       });
   };
 
@@ -204,7 +247,7 @@ const ViewCustomerDetails = () => {
       <Box ml='20px' color="red">
         {errorMessage && <div>{errorMessage}</div>}
       </Box>
-      {customerDetails && customerDetails.length > 0 ? (
+      {customerDetails ? (
         <Box ml='20px' mt='20px'>
           <Table variant="simple">
             <Thead>
@@ -214,7 +257,7 @@ const ViewCustomerDetails = () => {
             </Thead>
             <Tbody>
               <Tr>
-                <Td>{customerDetails[0].first_name} {customerDetails[0].last_name}</Td>
+                <Td>{customerDetails.first_name} {customerDetails.last_name}</Td>
               </Tr>
             </Tbody>
           </Table>
@@ -226,7 +269,7 @@ const ViewCustomerDetails = () => {
             </Thead>
             <Tbody>
               <Tr>
-                <Td>{customerDetails[0].email}</Td>
+                <Td>{customerDetails.email}</Td>
               </Tr>
             </Tbody>
           </Table>
@@ -238,7 +281,25 @@ const ViewCustomerDetails = () => {
             </Thead>
             <Tbody>
               <Tr>
-                <Td>{customerDetails[0].store_id}</Td>
+                <Td>{customerDetails.store_id}</Td>
+              </Tr>
+            </Tbody>
+          </Table>
+          <Table variant="simple">
+            <Thead>
+              <Tr>
+                <Th>Total Rentals</Th>
+                <Th>Currently Rented</Th>
+                <Th>Overdue</Th>
+                <Th>Last Rental</Th>
+              </Tr>
+            </Thead>
+            <Tbody>
+              <Tr>
+                <Td>{customerDetails.total_rentals}</Td>
+                <Td>{customerDetails.outstanding}</Td>
+                <Td>{customerDetails.overdue_count}</Td>
+                <Td>{customerDetails.last_rental_date ? new Date(customerDetails.last_rental_date).toLocaleDateString() : "N/A"}</Td>
               </Tr>
             </Tbody>
           </Table>
@@ -250,19 +311,22 @@ const ViewCustomerDetails = () => {
               </Tr>
             </Thead>
             <Tbody>
-            {customerDetails.map((customer, index) => (
-              <Tr key={index}>
-                <Td>{customer.title}</Td>
+            {rentals.map((rental) => (
+              <Tr key={rental.rental_id}>
+                <Td>{rental.title}</Td>
                 { /* If movie is not returned, print N/A */ }
-                <Td>{customer.return_date ? new Date(customer.return_date).toLocaleDateString() : "N/A"}</Td>  
+                <Td>{rental.return_date ? new Date(rental.return_date).toLocaleDateString() : "N/A"}</Td>  
               </Tr>
             ))}
             </Tbody>
           </Table>
+          {rentals.length === 0 && <Box mt='20px'>No rentals found for this customer.</Box>}
+          {nextCursor && (
+            <Button variant="outline" colorScheme="black" size="md" m="2" onClick={loadMoreRentals}>
+              Load more
+            </Button>
+          )}
         </Box>
-      ) : searched && (!customerDetails || customerDetails.length === 0) ? (
-        // If no rentals found for customer, display this
-        <Box ml='20px' mt='20px'>No rentals found for this customer.</Box>
       ) : null}
     </>
   );
@@ -614,19 +678,27 @@ const ViewCustomerList = () => {
   const [customers, setCustomers] = useState([]);
   const [currentPage, setCurrentPage] = useState(1);
   const [customersPerPage] = useState(40); // Display the number of customers per page
+  const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page of customers
 
-  // grabs the customer information from the database
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await axios.get('http://localhost:5000/viewCustomers');
-        setCustomers(response.data.customers);
-      } catch (error) {
+  // Grabs one page of customers from the database, starting after the given customer id
+  const loadPage = (after) => {
+    axios.get('http://localhost:5000/viewCustomers', { params: { limit: customersPerPage, after } })
+      .then(response => {
+        const loaded = customers.concat(response.data.customers);
+        setCustomers(loaded);
+        setNextCursor(response.data.next_cursor);
+        if (after) {
+          setCurrentPage(Math.ceil(loaded.length / customersPerPage)); // Show the page that was just loaded
+        }
+      })
+      .catch(error => {
         console.error('Error fetching data:', error);
-      }
-    };
+      });
+  };
 
-    fetchData();
+  // Only the first page is loaded up front, the rest on request with "Load more"
+  useEffect(() => {
+    loadPage(0);
   }, []);
 
   // Grabs the current customers based on the page
@@ -667,6 +739,11 @@ const ViewCustomerList = () => {
             {index + 1}
           </Button>
         ))}
+        {nextCursor && (
+          <Button variant="outline" colorScheme="black" onClick={() => loadPage(nextCursor)}>
+            Load more
+          </Button>
+        )}
       </HStack>
     </Box>
   );
@@ -876,7 +953,7 @@ const DisplayFilmDetails = () => {
     }
   
     const requestData = { 
-      inventory_id: details[0].inventory_id, 
+      film_id: details[0].film_id, 
       customer_id: fullName, 
       staff_id: staffId 
     };
@@ -0,0 +1,278 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import DateTime, bindparam, text
+
+RATINGS = ('G', 'PG', 'PG-13', 'R', 'NC-17')
+
+# Rows read per fetch while loading rentals
+LOAD_BATCH = 50000
+
+# Returns pick their return_date before they commit (a bulk return when the request starts), so one
+# can commit with a date older than the watermark. Every refresh reads the returns this far behind
+# the watermark again; this has to exceed the longest a return takes between picking its date and committing.
+RETURN_REREAD = timedelta(minutes=5)
+
+# Dimensions a report can be grouped by; the time buckets group on rental_date
+GROUPS = ('category', 'store', 'rating', 'film', 'customer', 'staff', 'rental_rate', 'day', 'week', 'month', 'year')
+METRICS = ('rentals', 'revenue', 'outstanding', 'overdue')
+MAX_GROUPS = 3
+
+# Keys spanning at most this many values are numbered by offset instead of by sorting, and group
+# combinations up to DENSE_GROUPS are summed straight into a bincount without sorting either
+DENSE_RANGE = 1 << 20
+DENSE_GROUPS = 1 << 22
+
+# Distinct values of the keys and the position of every key among them
+def factorize(keys):
+    if len(keys) and keys.max() - keys.min() < DENSE_RANGE:
+        low = keys.min()
+        return np.arange(low, keys.max() + 1), keys - low
+    values, codes = np.unique(keys, return_inverse=True)
+    return values, codes.reshape(-1)
+
+def to_datetimes(values):
+    # Handles datetime objects (MySQL) and ISO strings (SQLite); None becomes NaT
+    return np.array(values, dtype='datetime64[us]').astype('datetime64[s]')
+
+# Lookup array indexed by id. The extra last slot holds the fill value, so an id of -1 (unknown) reads it.
+def lookup(ids, values, fill, dtype):
+    table = np.full((max(ids, default=0) + 2,), fill, dtype=dtype)
+    table[list(ids)] = values
+    return table
+
+# Columnar snapshot of rental joined with inventory, film and film_category, for reports that
+# would otherwise be full-table GROUP BYs. New rentals are appended by rental_id and returns are
+# picked up through return_date; the small dimension tables are read in full on every refresh.
+class RentalAnalytics:
+    def __init__(self, refresh_interval=30):
+        self.lock = threading.RLock()
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = 0
+        self.categories = {}        # category id -> name
+        self._clear()
+
+    def _clear(self):
+        self.loaded = False
+        self.rental_id = np.empty(0, dtype=np.int64)
+        self.rental_date = np.empty(0, dtype='datetime64[s]')
+        self.rental_month = np.empty(0, dtype=np.int64)    # months since 1970-01, converting dates to months is slow
+        self.return_date = np.empty(0, dtype='datetime64[s]')
+        self.inventory_id = np.empty(0, dtype=np.int64)
+        self.customer_id = np.empty(0, dtype=np.int64)
+        self.staff_id = np.empty(0, dtype=np.int64)
+        self.max_rental_id = 0
+        self.return_watermark = None
+
+    # Film, store, category, rating and rate of every rental, looked up from the dimension tables
+    def _load_dimensions(self, connection):
+        inventory = connection.execute(text('SELECT inventory_id, film_id, store_id FROM inventory')).all()
+        films = connection.execute(text('SELECT film_id, rating, rental_rate, rental_duration FROM film')).all()
+        # Sakila files each film under one category; the lowest id wins if there are more
+        film_categories = connection.execute(text('''
+            SELECT film_id, MIN(category_id) AS category_id FROM film_category GROUP BY film_id
+        ''')).all()
+        self.categories = dict(connection.execute(text('SELECT category_id, name FROM category')).all())
+
+        inventory_film = lookup([row.inventory_id for row in inventory], [row.film_id for row in inventory], -1, np.int64)
+        inventory_store = lookup([row.inventory_id for row in inventory], [row.store_id for row in inventory], -1, np.int64)
+        film_ids = [row.film_id for row in films]
+        rating_codes = {rating: code for code, rating in enumerate(RATINGS)}
+        film_rating = lookup(film_ids, [rating_codes.get(row.rating, -1) for row in films], -1, np.int64)
+        film_rate = lookup(film_ids, [int(round(float(row.rental_rate) * 100)) for row in films], 0, np.int64)
+        film_duration = lookup(film_ids, [row.rental_duration for row in films], 0, np.int64)
+        film_category = lookup([row.film_id for row in film_categories], [row.category_id for row in film_categories], -1, np.int64)
+
+        # Ids past the end of a lookup table (rows added since it was read) map to the fill slot too
+        def at(table, ids):
+            return table[np.where((ids >= 0) & (ids < len(table) - 1), ids, -1)]
+
+        self.film_id = at(inventory_film, self.inventory_id)
+        self.store_id = at(inventory_store, self.inventory_id)
+        self.category_id = at(film_category, self.film_id)
+        self.rating = at(film_rating, self.film_id)
+        self.rate_cents = at(film_rate, self.film_id)
+        self.due_date = self.rental_date + at(film_duration, self.film_id).astype('timedelta64[D]')
+
+    def _append_rentals(self, connection):
+        result = connection.execution_options(stream_results=True).execute(text('''
+            SELECT rental_id, rental_date, return_date, inventory_id, customer_id, staff_id
+            FROM rental
+            WHERE rental_id > :after
+            ORDER BY rental_id
+        '''), {'after': self.max_rental_id})
+
+        added = 0
+        for rows in result.partitions(LOAD_BATCH):
+            rental_id, rental_date, return_date, inventory_id, customer_id, staff_id = zip(*rows)
+            self.rental_id = np.concatenate([self.rental_id, np.array(rental_id, dtype=np.int64)])
+            rental_date = to_datetimes(rental_date)
+            self.rental_date = np.concatenate([self.rental_date, rental_date])
+            self.rental_month = np.concatenate([self.rental_month, rental_date.astype('datetime64[M]').astype(np.int64)])
+            self.return_date = np.concatenate([self.return_date, to_datetimes(return_date)])
+            self.inventory_id = np.concatenate([self.inventory_id, np.array(inventory_id, dtype=np.int64)])
+            self.customer_id = np.concatenate([self.customer_id, np.array(customer_id, dtype=np.int64)])
+            self.staff_id = np.concatenate([self.staff_id, np.array(staff_id, dtype=np.int64)])
+            added += len(rows)
+        if added:
+            self.max_rental_id = int(self.rental_id[-1])
+        return added
+
+    # Rentals returned since RETURN_REREAD before the watermark, so returns that committed late and
+    # more returns in the watermark's own second are picked up; setting the same date twice is harmless.
+    def _apply_returns(self, connection):
+        since = None
+        if self.return_watermark is not None:
+            since = datetime.fromisoformat(str(self.return_watermark)) - RETURN_REREAD
+        condition = 'return_date IS NOT NULL' if since is None else 'return_date >= :since'
+        query = text(f'''
+            SELECT rental_id, return_date
+            FROM rental
+            WHERE {condition} AND rental_id <= :max_rental_id
+        ''')
+        if since is not None:
+            query = query.bindparams(bindparam('since', type_=DateTime))
+        rows = connection.execute(query, {'since': since, 'max_rental_id': self.max_rental_id}).all()
+        if not rows:
+            return 0
+        self.return_watermark = max(row.return_date for row in rows)
+
+        # Returns read again within RETURN_REREAD are already applied; only count the ones that changed
+        rental_ids = np.array([row.rental_id for row in rows], dtype=np.int64)
+        positions = np.searchsorted(self.rental_id, rental_ids)
+        found = (positions < len(self.rental_id)) & (self.rental_id[np.minimum(positions, len(self.rental_id) - 1)] == rental_ids)
+        return_dates = to_datetimes([row.return_date for row in rows])[found]
+        positions = positions[found]
+        changed = self.return_date[positions] != return_dates
+        self.return_date[positions] = return_dates
+        return int(changed.sum())
+
+    # Reads the rentals added and returned since the previous call (everything on the first call).
+    # Returns the number of rentals added or updated.
+    def refresh(self, connection):
+        with self.lock:
+            first_load = not self.loaded
+            if first_load:
+                # Taken before the rentals are read, so returns made during the load are applied next time
+                self.return_watermark = connection.execute(text('SELECT MAX(return_date) FROM rental')).scalar()
+            changed = self._append_rentals(connection)
+            if not first_load:
+                changed += self._apply_returns(connection)
+            self._load_dimensions(connection)
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+            return changed
+
+    # Drops the snapshot and loads it from scratch, which also picks up deleted or edited rentals
+    def reload(self, connection):
+        with self.lock:
+            self._clear()
+            return self.refresh(connection)
+
+    def stale(self):
+        return not self.loaded or time.monotonic() - self.refreshed_at >= self.refresh_interval
+
+    def category_id_of(self, name):
+        for category_id, category_name in self.categories.items():
+            if category_name.lower() == name.lower():
+                return category_id
+        return None
+
+    # Integer key of every selected rental for one group-by dimension
+    def _group_keys(self, group, selected):
+        if group in ('month', 'year'):
+            months = self.rental_month[selected]
+            return months if group == 'month' else months // 12
+        if group in ('day', 'week'):
+            days = self.rental_date[selected].astype('datetime64[D]').astype(np.int64)
+            # Day 0 (1970-01-01) was a Thursday; weeks start on Monday
+            return days if group == 'day' else days - (days + 3) % 7
+        column = {'category': self.category_id, 'store': self.store_id, 'rating': self.rating, 'film': self.film_id,
+                  'customer': self.customer_id, 'staff': self.staff_id, 'rental_rate': self.rate_cents}[group]
+        return column[selected]
+
+    def _labels(self, group, keys):
+        if group == 'category':
+            return [self.categories.get(key) for key in keys.tolist()]
+        if group == 'rating':
+            return [RATINGS[key] if key >= 0 else None for key in keys.tolist()]
+        if group == 'rental_rate':
+            return (keys / 100).tolist()
+        if group in ('day', 'week'):
+            return [str(day) for day in keys.astype('datetime64[D]')]
+        if group == 'month':
+            return [str(month) for month in keys.astype('datetime64[M]')]
+        if group == 'year':
+            return [str(year) for year in keys.astype('datetime64[Y]')]
+        return keys.tolist()
+
+    def _metric_values(self, metric, selected, now):
+        if metric == 'rentals':
+            return np.ones(len(selected), dtype=np.int64)
+        if metric == 'revenue':
+            return self.rate_cents[selected]
+        is_open = np.isnat(self.return_date[selected])
+        if metric == 'outstanding':
+            return is_open.astype(np.int64)
+        # Overdue: still out past the due date, or returned after it
+        ended = np.where(is_open, now, self.return_date[selected])
+        return (ended > self.due_date[selected]).astype(np.int64)
+
+    # Aggregates the metric over the rentals matching the filters, grouped by the given dimensions.
+    # filters maps a group dimension (category, store, rating, film, customer, staff) to the id or
+    # code to keep, plus optional since/until ISO dates bounding rental_date and status open/returned.
+    # Returns the column names, the rows (group labels then the value) and the total over all groups.
+    def report(self, metric, group_by=(), filters=None, top=None):
+        filters = filters or {}
+        with self.lock:
+            mask = np.ones(len(self.rental_id), dtype=bool)
+            for group, value in filters.items():
+                if group == 'since':
+                    mask &= self.rental_date >= np.datetime64(value, 's')
+                elif group == 'until':
+                    mask &= self.rental_date < np.datetime64(value, 's')
+                elif group == 'status':
+                    is_open = np.isnat(self.return_date)
+                    mask &= is_open if value == 'open' else ~is_open
+                else:
+                    mask &= self._group_keys(group, slice(None)) == value
+            selected = np.flatnonzero(mask)
+
+            # Rental dates are stored as naive local times, so overdue is judged against local time, not UTC
+            values = self._metric_values(metric, selected, np.datetime64(datetime.now()))
+            columns = list(group_by) + [metric]
+            if not group_by:
+                total = values.sum()
+                return columns, [(self._value(metric, total),)], self._value(metric, total)
+
+            # Numbers the distinct keys of every dimension, then folds them into one integer per rental
+            uniques, codes = zip(*(factorize(self._group_keys(group, selected)) for group in group_by))
+            shape = [len(unique) for unique in uniques]
+            combined = np.ravel_multi_index(codes, shape)
+            if np.prod(shape) <= DENSE_GROUPS:
+                group_ids = np.flatnonzero(np.bincount(combined, minlength=np.prod(shape)))
+                sums = np.bincount(combined, weights=values, minlength=np.prod(shape))[group_ids]
+            else:
+                group_ids, inverse = np.unique(combined, return_inverse=True)
+                sums = np.bincount(inverse.reshape(-1), weights=values, minlength=len(group_ids))
+
+            # Groups come sorted by key (oldest bucket first); top=k keeps the k largest instead
+            order = np.arange(len(group_ids))
+            if top:
+                order = np.argsort(-sums, kind='stable')[:top]
+            positions = np.unravel_index(group_ids[order], shape)
+            labels = [self._labels(group, unique[position]) for group, unique, position in zip(group_by, uniques, positions)]
+            rows = list(zip(*labels, [self._value(metric, value) for value in sums[order].tolist()]))
+            return columns, rows, self._value(metric, values.sum())
+
+    def _value(self, metric, value):
+        if metric == 'revenue':
+            return round(float(value) / 100, 2)
+        return int(value)
+
+    def stats(self):
+        with self.lock:
+            return {'rentals': len(self.rental_id), 'max_rental_id': self.max_rental_id,
+                    'refreshed_seconds_ago': round(time.monotonic() - self.refreshed_at, 1) if self.loaded else None}
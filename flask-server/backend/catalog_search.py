@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from search_index import TrigramIndex
+
+# How much a description match counts compared to a title match
+DESCRIPTION_WEIGHT = 0.2
+
+# Results scoring below this fraction of the best match are dropped as noise
+RELATIVE_CUTOFF = 0.5
+
+# In-memory search over film titles, film descriptions and actor names, plus the
+# actor -> films mapping, so the title and actor search routes never scan the database.
+# Changes are picked up incrementally through the last_update column of each table.
+class CatalogSearch:
+    def __init__(self, refresh_interval=60):
+        self.lock = threading.RLock()
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self.refreshed_at = 0
+        self.titles = TrigramIndex()
+        self.descriptions = TrigramIndex()
+        self.actors = TrigramIndex()
+        self.film_titles = {}                 # film id -> title
+        self.actor_names = {}                 # actor id -> (first name, last name)
+        self.actor_films = defaultdict(set)   # actor id -> film ids
+        self._watermarks = {}                 # table -> last_update seen
+        self._versions = {}                   # (table, key) -> last_update applied
+
+    # Rows of the table changed since the previous call. Rows stamped with the watermark itself are
+    # read again, since more may have been written in that same second, but only applied once.
+    def _changed_rows(self, session, table, query, key):
+        since = self._watermarks.get(table)
+        if since is None:
+            rows = session.execute(text(query)).all()
+        else:
+            rows = session.execute(text(query + ' WHERE last_update >= :since'), {'since': since}).all()
+        if rows:
+            self._watermarks[table] = max(row.last_update for row in rows)
+
+        changed = []
+        for row in rows:
+            version_key = (table, key(row))
+            if self._versions.get(version_key) != row.last_update:
+                self._versions[version_key] = row.last_update
+                changed.append(row)
+        return changed
+
+    # Reads every row changed since the previous call (all rows on the first call).
+    # Returns the number of rows applied per table, e.g. {'film': 2, 'actor': 0, 'film_actor': 0}.
+    def refresh(self, session):
+        with self.lock:
+            films = self._changed_rows(session, 'film', 'SELECT film_id, title, description, last_update FROM film',
+                                       lambda row: row.film_id)
+            for row in films:
+                self.film_titles[row.film_id] = row.title
+                self.titles.add(row.film_id, row.title)
+                self.descriptions.add(row.film_id, row.description)
+
+            actors = self._changed_rows(session, 'actor', 'SELECT actor_id, first_name, last_name, last_update FROM actor',
+                                        lambda row: row.actor_id)
+            for row in actors:
+                self.actor_names[row.actor_id] = (row.first_name, row.last_name)
+                self.actors.add(row.actor_id, row.first_name, row.last_name)
+
+            film_actors = self._changed_rows(session, 'film_actor', 'SELECT actor_id, film_id, last_update FROM film_actor',
+                                             lambda row: (row.actor_id, row.film_id))
+            for row in film_actors:
+                self.actor_films[row.actor_id].add(row.film_id)
+
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+            return {'film': len(films), 'actor': len(actors), 'film_actor': len(film_actors)}
+
+    # Drops everything and loads from scratch, which also picks up deleted rows
+    def reload(self, session):
+        with self.lock:
+            for index in (self.titles, self.descriptions, self.actors):
+                index.clear()
+            self.film_titles.clear()
+            self.actor_names.clear()
+            self.actor_films.clear()
+            self._watermarks.clear()
+            self._versions.clear()
+            return self.refresh(session)
+
+    # Loads on first use and refreshes once the refresh interval has passed.
+    # Returns the changed rows applied per table, like refresh().
+    def ensure_fresh(self, session):
+        if self.loaded and time.monotonic() - self.refreshed_at < self.refresh_interval:
+            return {}
+        with self.lock:
+            if self.loaded and time.monotonic() - self.refreshed_at < self.refresh_interval:
+                return {}
+            return self.refresh(session)
+
+    def _cut(self, ranked, limit):
+        if not ranked:
+            return []
+        best = ranked[0][1]
+        return [(doc_id, score) for doc_id, score in ranked if score >= best * RELATIVE_CUTOFF][:limit]
+
+    # Films ranked by title match, with description matches as a weaker signal
+    def search_films(self, query, limit=10):
+        with self.lock:
+            scores = defaultdict(float)
+            for film_id, score in self.titles.search(query, limit * 10):
+                scores[film_id] += score
+            for film_id, score in self.descriptions.search(query, limit * 10):
+                scores[film_id] += score * DESCRIPTION_WEIGHT
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return [(film_id, self.film_titles[film_id]) for film_id, score in self._cut(ranked, limit)]
+
+    # Actors ranked by name match, as (actor id, first name, last name, film ids)
+    def search_actors(self, query, limit=10):
+        with self.lock:
+            ranked = self._cut(self.actors.search(query, limit * 10), limit)
+            return [(actor_id, *self.actor_names[actor_id], sorted(self.actor_films.get(actor_id, ())))
+                    for actor_id, score in ranked]
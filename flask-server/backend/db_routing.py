@@ -0,0 +1,128 @@
+import itertools
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.elements import TextClause
+
+# Cookie that keeps a client on the primary for a short while after it wrote something.
+# Browsers only send it back on same-origin (or credentialed CORS) requests, so the same
+# deadline is also returned in a response header that cross-origin clients such as the
+# React app echo back on their next requests. A client that does neither reads from the
+# replicas straight away and may not see its own write until they catch up.
+STICKY_COOKIE = 'read_primary_until'
+STICKY_HEADER = 'X-Read-Primary-Until'
+
+def is_read(clause):
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith('SELECT')
+    return bool(getattr(clause, 'is_select', False))
+
+# Session that sends SELECTs to a read replica when the current request allows it.
+# Everything else goes to the primary, and once a request has written, its later
+# reads follow it to the primary so it always sees its own writes.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or not is_read(clause):
+                g.db_wrote = True
+            elif g.get('read_replica') and not g.get('db_wrote'):
+                replica = replica_engine()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class ReplicaRouter:
+    def __init__(self, sticky_seconds=5):
+        self.sticky_seconds = sticky_seconds
+        self._next = itertools.count()
+
+    def init_app(self, app, db):
+        self.db = db
+        app.extensions['replica_router'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def replica_keys(self):
+        return sorted(key for key in self.db.engines if key and key.startswith('replica'))
+
+    # Reads may go to a replica unless this client wrote within the last few seconds,
+    # according to either the cookie or the header it echoed back
+    def replica_allowed(self):
+        now = time.time()
+        for value in (request.cookies.get(STICKY_COOKIE), request.headers.get(STICKY_HEADER)):
+            try:
+                if value and float(value) >= now:
+                    return False
+            except ValueError:
+                continue
+        return True
+
+    def _before_request(self):
+        g.read_replica = request.method in ('GET', 'HEAD') and self.replica_allowed()
+
+    def _after_request(self, response):
+        if g.get('db_wrote') and self.replica_keys():
+            until = time.time() + self.sticky_seconds
+            response.set_cookie(STICKY_COOKIE, str(until), max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+            response.headers[STICKY_HEADER] = str(until)
+        return response
+
+    # Picks a replica for the current request (round robin), sticking with it for the whole request
+    def pick(self):
+        keys = self.replica_keys()
+        if not keys:
+            return None
+        key = g.get('replica_key')
+        if key is None:
+            key = g.replica_key = keys[next(self._next) % len(keys)]
+        return self.db.engines[key]
+
+    # Keeps a GET handler's reads on the primary. Used for the tables the app creates and keeps up to
+    # date itself (film_availability, customer_rental_summary): they are created lazily on the primary,
+    # so a replica only has them once replication has copied them over, and a lagging replica would
+    # serve counts from before the latest rental or return.
+    def primary_reads(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.read_replica = False
+            return view(*args, **kwargs)
+        return wrapper
+
+    # Lets a read-only handler that is not a GET (e.g. a batch lookup) read from the replicas
+    def replica_reads(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.read_replica = self.replica_allowed()
+            return view(*args, **kwargs)
+        return wrapper
+
+    # Engine for reads outside the session, such as streaming from a server-side cursor
+    def read_engine(self):
+        if g.get('read_replica') and not g.get('db_wrote'):
+            replica = self.pick()
+            if replica is not None:
+                return replica
+        return self.db.engine
+
+    # Pool usage of every bind, to see how close each one is to running out of connections
+    def pool_stats(self):
+        stats = {}
+        for key, engine in self.db.engines.items():
+            pool = engine.pool
+            entry = {'status': pool.status()}
+            for method in ('size', 'checkedout', 'overflow', 'checkedin'):
+                if hasattr(pool, method):
+                    entry[method] = getattr(pool, method)()
+            if 'size' in entry and 'checkedout' in entry:
+                capacity = entry['size'] + max(getattr(pool, '_max_overflow', 0), 0)
+                entry['saturation'] = entry['checkedout'] / capacity if capacity else 0.0
+            stats[key or 'default'] = entry
+        return stats
+
+def replica_engine():
+    router = current_app.extensions.get('replica_router')
+    return router.pick() if router else None
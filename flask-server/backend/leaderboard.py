@@ -0,0 +1,57 @@
+import heapq
+import threading
+
+# Keeps a running count per key together with the `capacity` highest counts in rank order,
+# so reading the top N is a slice instead of an aggregation over the source table.
+class Leaderboard:
+    def __init__(self, capacity):
+        self.lock = threading.RLock()
+        self.capacity = capacity
+        self.loaded = False
+        self._counts = {}     # key -> count
+        self._details = {}    # key -> extra fields returned with the entry
+        self._ranking = []    # keys of the highest counts, best first
+
+    def _sort_key(self, key):
+        return (-self._counts[key], key)
+
+    # Replaces every count with `rows` of (key, count, details)
+    def rebuild(self, rows):
+        with self.lock:
+            self._counts = {}
+            self._details = {}
+            for key, count, details in rows:
+                self._counts[key] = count
+                self._details[key] = details
+            self._rerank()
+            self.loaded = True
+
+    def _rerank(self):
+        self._ranking = heapq.nsmallest(self.capacity, self._counts, key=self._sort_key)
+
+    def increment(self, key, amount=1, details=None):
+        with self.lock:
+            self._counts[key] = self._counts.get(key, 0) + amount
+            if details is not None:
+                self._details[key] = details
+
+            if amount < 0:
+                # A key dropping out of the ranking may be overtaken by one we are not tracking
+                if key in self._ranking:
+                    self._rerank()
+                return
+
+            if key in self._ranking:
+                self._ranking.sort(key=self._sort_key)
+            elif len(self._ranking) < self.capacity or self._sort_key(key) < self._sort_key(self._ranking[-1]):
+                self._ranking.append(key)
+                self._ranking.sort(key=self._sort_key)
+                del self._ranking[self.capacity:]
+
+    def has_details(self, key):
+        return key in self._details
+
+    # Returns the first n entries as (key, count, details)
+    def top(self, n):
+        with self.lock:
+            return [(key, self._counts[key], self._details.get(key, {})) for key in self._ranking[:n]]
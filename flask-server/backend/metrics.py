@@ -0,0 +1,203 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger('slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Collapses whitespace and expanded IN (...) parameter lists so one statement is one label
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+
+def normalize_statement(statement):
+    statement = ' '.join(statement.split())
+    return PLACEHOLDER_LIST.sub('(...)', statement)[:300]
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}   # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][position] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+            labels = format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = defaultdict(float)
+
+    def inc(self, amount, *label_values):
+        self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+# Request, SQL and connection pool instrumentation, exposed in the Prometheus text format.
+# Statement timings come from SQLAlchemy engine events so every engine (and bind) is covered.
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slow_query_seconds = 0.2
+        self.explain_slow_queries = False
+        self._pools = {}   # name -> pool, for the saturation gauges
+        self._local = threading.local()
+
+        self.request_duration = Histogram('http_request_duration_seconds', 'Request latency by route.', ('method', 'route', 'status'))
+        self.request_queries = Histogram('http_request_queries', 'SQL statements executed per request.', ('route',), COUNT_BUCKETS)
+        self.statement_duration = Histogram('db_statement_duration_seconds', 'SQL statement execution time.', ('statement',))
+        self.statement_rows = Counter('db_statement_rows_total', 'Rows returned or affected by SQL statements.', ('statement',))
+        self.slow_queries = Counter('db_slow_queries_total', 'SQL statements slower than the slow query threshold.', ('statement',))
+        self.checkout_wait = Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.', ('pool',))
+
+    def init_app(self, app, db):
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        self.explain_slow_queries = app.config.get('SLOW_QUERY_EXPLAIN', False)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                self.instrument_pool(bind_key or 'default', engine)
+
+    # Times pool checkouts by wrapping the pool's connect(), which every new Connection goes through
+    def instrument_pool(self, name, engine):
+        pool = engine.pool
+        connect = pool.connect
+
+        def timed_connect():
+            start = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                with self.lock:
+                    self.checkout_wait.observe(time.perf_counter() - start, name)
+
+        pool.connect = timed_connect
+        self._pools[name] = pool
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        with self.lock:
+            self.request_duration.observe(time.perf_counter() - start, request.method, route, response.status_code)
+            self.request_queries.observe(g.pop('metrics_queries', 0), route)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        if getattr(self._local, 'explaining', False):
+            return
+
+        normalized = normalize_statement(statement)
+        rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        with self.lock:
+            self.statement_duration.observe(elapsed, normalized)
+            self.statement_rows.inc(rows, normalized)
+            if elapsed >= self.slow_query_seconds:
+                self.slow_queries.inc(1, normalized)
+        if has_request_context():
+            g.metrics_queries = g.get('metrics_queries', 0) + 1
+
+        if elapsed >= self.slow_query_seconds:
+            self._log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    def _log_slow_query(self, conn, statement, parameters, executemany, elapsed):
+        plan = None
+        if self.explain_slow_queries and not executemany and statement.lstrip().upper().startswith('SELECT'):
+            plan = self._explain(conn, statement, parameters)
+        route = request.path if has_request_context() else None
+        slow_query_log.warning('Slow query (%.1f ms) on %s: %s | parameters=%r%s', elapsed * 1000, route, ' '.join(statement.split()),
+                               parameters, f' | plan={plan}' if plan else '')
+
+    # Runs EXPLAIN for the statement on its own connection, without recording it as a query
+    def _explain(self, conn, statement, parameters):
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        self._local.explaining = True
+        try:
+            with conn.engine.connect() as explain_conn:
+                cursor = explain_conn.connection.cursor()
+                try:
+                    cursor.execute(prefix + statement, parameters)
+                    return [tuple(row) for row in cursor.fetchall()]
+                finally:
+                    cursor.close()
+        except Exception as e:
+            return f'unavailable ({e})'
+        finally:
+            self._local.explaining = False
+
+    def _pool_gauges(self):
+        lines = []
+        gauges = (('db_pool_size', 'size', 'Configured pool size.'),
+                  ('db_pool_checked_out', 'checkedout', 'Connections currently checked out.'),
+                  ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size.'))
+        for metric, method, help_text in gauges:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+            for name, pool in sorted(self._pools.items()):
+                if hasattr(pool, method):
+                    lines.append(f'{metric}{format_labels(("pool",), (name,))} {getattr(pool, method)()}')
+        return lines
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (self.request_duration, self.request_queries, self.statement_duration,
+                           self.statement_rows, self.slow_queries, self.checkout_wait):
+                lines += metric.render()
+            lines += self._pool_gauges()
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
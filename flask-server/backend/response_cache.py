@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request
+
+class CacheEntry:
+    def __init__(self, body, mimetype, tags, ttl):
+        self.body = body
+        self.mimetype = mimetype
+        self.tags = tags
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.expires = time.monotonic() + ttl
+
+    def to_response(self):
+        response = Response(self.body, mimetype=self.mimetype)
+        response.set_etag(self.etag)
+        response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        # Answers If-None-Match / If-Modified-Since with a 304 when the client copy is current
+        return response.make_conditional(request)
+
+# Size bounded LRU cache of rendered GET responses with a TTL on every entry.
+# Entries carry tags (e.g. "film:12") so writes can drop exactly what they affect.
+# Every invalidation also bumps a per-tag generation, so a response rendered before a
+# write that affects it is not stored once that write has invalidated its tags.
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> CacheEntry, least recently used first
+        self._tagged = {}               # tag -> keys of the entries carrying it
+        self._generations = {}          # tag -> number of times it has been invalidated
+        self._clears = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    # Snapshot of the invalidation counts of the given tags, taken before rendering a response
+    def generation(self, tags):
+        with self.lock:
+            return self._generation(tags)
+
+    def _generation(self, tags):
+        return (self._clears,) + tuple(self._generations.get(tag, 0) for tag in tags)
+
+    # Stores a rendered response. With a generation from before the response was rendered, the entry
+    # is dropped instead when any of its tags has been invalidated since, as it may predate that write.
+    def put(self, key, body, mimetype, tags=(), generation=None):
+        tags = tuple(tags)
+        entry = CacheEntry(body, mimetype, frozenset(tags), self.ttl)
+        with self.lock:
+            if generation is not None and generation != self._generation(tags):
+                self.stale_puts += 1
+                return entry
+            self._drop(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    # Removes every entry carrying any of the given tags
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._tagged.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self._clears += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_puts': self.stale_puts,
+            }
+
+    # Caches a GET view keyed by path and query string. Tags may use the view's
+    # URL arguments, e.g. cached('film', 'film:{film_id}').
+    def cached(self, *tags):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = self.get(key)
+                if entry is None:
+                    entry_tags = [tag.format(**kwargs) for tag in tags]
+                    generation = self.generation(entry_tags)
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    entry = self.put(key, response.get_data(), response.mimetype, entry_tags, generation)
+                return entry.to_response()
+            return wrapper
+        return decorator
@@ -0,0 +1,128 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+# Minimum trigram similarity for a token to count as a (typo tolerant) match
+MIN_SIMILARITY = 0.3
+
+# Scores given to a query token that matches a document token exactly or as a prefix
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.9
+
+def tokenize(value):
+    if not value:
+        return []
+    return re.findall(r'[a-z0-9]+', str(value).lower())
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# In-process trigram/prefix index mapping free-text fields to document ids.
+# Tokens are indexed once no matter how many documents contain them, so a lookup
+# only compares the query against the distinct vocabulary, not every document.
+class TrigramIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        # Highest key seen by a bulk loader, so it can resume from where it stopped
+        self.watermark = 0
+        self._documents = {}                  # doc id -> set of tokens
+        self._postings = defaultdict(set)     # token -> doc ids
+        self._grams = defaultdict(set)        # trigram -> tokens
+        self._vocabulary = []                 # sorted tokens, for prefix lookups
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._documents
+
+    # Adds a document, replacing whatever was indexed under the same id
+    def add(self, doc_id, *fields):
+        tokens = {token for field in fields for token in tokenize(field)}
+        with self.lock:
+            self._discard(doc_id)
+            self._documents[doc_id] = tokens
+            for token in tokens:
+                if token not in self._postings:
+                    insort(self._vocabulary, token)
+                    for gram in trigrams(token):
+                        self._grams[gram].add(token)
+                self._postings[token].add(doc_id)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._discard(doc_id)
+
+    def clear(self):
+        with self.lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._grams.clear()
+            self._vocabulary.clear()
+            self.loaded = False
+            self.watermark = 0
+
+    def _discard(self, doc_id):
+        tokens = self._documents.pop(doc_id, None)
+        if not tokens:
+            return
+        for token in tokens:
+            postings = self._postings[token]
+            postings.discard(doc_id)
+            if postings:
+                continue
+            # Last document using this token, drop it from the vocabulary as well
+            del self._postings[token]
+            self._vocabulary.pop(bisect_left(self._vocabulary, token))
+            for gram in trigrams(token):
+                self._grams[gram].discard(token)
+                if not self._grams[gram]:
+                    del self._grams[gram]
+
+    # Scores every indexed token against a single query token
+    def _match_token(self, query_token):
+        matches = {}
+
+        # Prefix matches (this also covers exact matches)
+        position = bisect_left(self._vocabulary, query_token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(query_token):
+            token = self._vocabulary[position]
+            matches[token] = EXACT_SCORE if token == query_token else PREFIX_SCORE
+            position += 1
+
+        # Typo tolerant matches, scored with the Dice coefficient over trigrams
+        query_grams = trigrams(query_token)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for token in self._grams.get(gram, ()):
+                shared[token] += 1
+        for token, count in shared.items():
+            if token in matches:
+                continue
+            similarity = 2 * count / (len(query_grams) + len(trigrams(token)))
+            if similarity >= MIN_SIMILARITY:
+                matches[token] = similarity * PREFIX_SCORE
+        return matches
+
+    # Returns up to `limit` (doc id, score) pairs, best match first
+    def search(self, query, limit=10):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        scores = defaultdict(float)
+        with self.lock:
+            for query_token in query_tokens:
+                best = {}
+                for token, score in self._match_token(query_token).items():
+                    for doc_id in self._postings[token]:
+                        if score > best.get(doc_id, 0):
+                            best[doc_id] = score
+                for doc_id, score in best.items():
+                    scores[doc_id] += score
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,104 @@
+import decimal
+import gzip
+from datetime import date
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Same conversions as Flask's default encoder, so both encoders produce the same output
+def json_default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+if orjson is not None:
+    # Dates are passed to json_default instead of being written as ISO 8601
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+# JSON provider that encodes with orjson when it is installed and falls back to the standard
+# library encoder otherwise. Values come out the same either way (dates as HTTP dates, decimals as strings).
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# Rows of a result as the response payload, built from the row tuples and the cursor's column
+# names, so the SQL aliases are the JSON keys. ?shape=columnar sends the column names once
+# ({"columns": [...], "rows": [[...]]}) instead of repeating them in every row.
+def rows_payload(key, columns, rows, **extra):
+    columns = list(columns)
+    if request.args.get('shape') == 'columnar':
+        payload = {'columns': columns, 'rows': [tuple(row) for row in rows]}
+    else:
+        payload = {key: [dict(zip(columns, row)) for row in rows]}
+    payload.update(extra)
+    return payload
+
+def result_payload(key, result, **extra):
+    return rows_payload(key, result.keys(), result.all(), **extra)
+
+def accepted_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+# Compresses large JSON and text responses with brotli or gzip, whichever the client accepts
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < current_app.config.get('COMPRESS_MIN_BYTES', COMPRESS_MIN_BYTES):
+        return response
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+
+    # The encoded bytes differ from what the ETag was computed on, so it is only a weak match now
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.engine import make_url
+
+import dataset
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Load test for every route of the Flask app against a generated Sakila-shaped dataset.
+# Each endpoint is driven on its own by `--concurrency` threads, then all of them together
+# as a weighted mix. The endpoints write to the dataset, so every run works on a fresh copy of it. Latency percentiles, throughput and the peak RSS sampled during each
+# phase are reported per endpoint and, with --baseline, compared against a stored run.
+
+# How often the resident set size is sampled while a phase runs
+RSS_SAMPLE_SECONDS = 0.005
+
+class Workload:
+    def __init__(self, counts, open_rentals, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.customers = counts['customers']
+        self.open_rentals = deque(open_rentals)
+        self.added_customers = deque()
+
+    def randint(self, low, high):
+        with self.lock:
+            return self.rng.randint(low, high)
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def sample(self, high, count):
+        with self.lock:
+            return self.rng.sample(range(1, high + 1), count)
+
+    def open_rental(self):
+        with self.lock:
+            return self.open_rentals.popleft() if self.open_rentals else self.rng.randint(1, dataset.RENTALS)
+
+    def rented(self, response):
+        if response.status_code == 201:
+            with self.lock:
+                self.open_rentals.append(response.get_json()['rental_id'])
+
+    def added(self, response):
+        if response.status_code == 201:
+            with self.lock:
+                self.added_customers.append(response.get_json()['customer_id'])
+
+    # A customer the benchmark added itself, or one that does not exist once they run out
+    def added_customer(self):
+        with self.lock:
+            return self.added_customers.popleft() if self.added_customers else self.customers + 10 ** 6
+
+    def new_customer(self):
+        return {'store_id': 1, 'first_name': self.choice(dataset.FIRST_NAMES), 'last_name': self.choice(dataset.LAST_NAMES),
+                'email': 'bench@example.org', 'address_id': 1}
+
+# name, weight in the mix, method, builder returning (path, json body), accepted statuses.
+# The refresh and rebuild routes have weight 0: they are measured on their own but kept out of the mix.
+def endpoints(work):
+    return [
+        ('GET /viewCustomers', 5, 'GET', lambda: (f'/viewCustomers?limit=100&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /viewCustomers (columnar)', 2, 'GET', lambda: (f'/viewCustomers?limit=1000&shape=columnar&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /viewCustomers (ndjson)', 1, 'GET', lambda: (f'/viewCustomers?stream=ndjson&limit=1000&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /viewCustomers (json stream)', 1, 'GET', lambda: (f'/viewCustomers?stream=json&limit=1000&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /searchCustomer (name)', 10, 'GET', lambda: (f'/searchCustomer?searchInput={work.choice(dataset.FIRST_NAMES)}', None), (200,)),
+        ('GET /searchCustomer (id)', 5, 'GET', lambda: (f'/searchCustomer?searchInput={work.randint(1, work.customers)}', None), (200,)),
+        ('GET /searchCustomer (ndjson)', 1, 'GET', lambda: (f'/searchCustomer?stream=ndjson&limit=1000&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /searchCustomer (json stream)', 1, 'GET', lambda: (f'/searchCustomer?stream=json&limit=1000&after={work.randint(0, work.customers)}', None), (200,)),
+        ('GET /viewCustomerDetails', 5, 'GET', lambda: (f'/viewCustomerDetails/{work.randint(1, work.customers)}', None), (200,)),
+        ('GET /viewCustomerDetails/rentals', 2, 'GET', lambda: (f'/viewCustomerDetails/{work.randint(1, work.customers)}/rentals?limit=50', None), (200,)),
+        ('GET /topFiveFilms', 10, 'GET', lambda: ('/topFiveFilms', None), (200,)),
+        ('GET /topFiveActors', 10, 'GET', lambda: ('/topFiveActors', None), (200,)),
+        ('GET /displayFilmDetails', 15, 'GET', lambda: (f'/displayFilmDetails/{work.randint(1, dataset.FILMS)}', None), (200,)),
+        ('GET /displayActorDetails', 5, 'GET', lambda: (f'/displayActorDetails/{work.randint(1, dataset.ACTORS)}', None), (200,)),
+        ('GET /searchByTitle', 10, 'GET', lambda: (f'/searchByTitle/{work.choice(dataset.TITLE_WORDS)}', None), (200,)),
+        ('GET /searchByCategory', 5, 'GET', lambda: (f'/searchByCategory/{work.choice(dataset.CATEGORIES)}', None), (200,)),
+        ('GET /searchByActor', 5, 'GET', lambda: (f'/searchByActor/{work.choice(dataset.FIRST_NAMES)} {work.choice(dataset.LAST_NAMES)}', None), (200,)),
+        ('GET /analytics', 2, 'GET', lambda: (f'/analytics?metric={work.choice(["rentals", "revenue", "overdue"])}&group_by=category,month', None), (200,)),
+        ('GET /analytics (top)', 2, 'GET', lambda: (f'/analytics?metric=revenue&group_by=film&top=10&store={work.randint(1, 2)}', None), (200,)),
+        ('POST /films/details', 2, 'POST', lambda: ('/films/details', {'ids': work.sample(dataset.FILMS, 50)}), (200,)),
+        ('POST /actors/details', 2, 'POST', lambda: ('/actors/details', {'ids': work.sample(dataset.ACTORS, 20)}), (200,)),
+        ('POST /addRental', 4, 'POST', lambda: ('/addRental', {'film_id': work.randint(1, dataset.FILMS), 'customer_id': work.randint(1, work.customers),
+                                                               'staff_id': 1}), (201, 404, 409)),
+        ('POST /returnMovie', 4, 'POST', lambda: (f'/returnMovie/{work.open_rental()}', None), (200, 400)),
+        ('POST /addCustomer', 1, 'POST', lambda: ('/addCustomer', work.new_customer()), (201,)),
+        ('PATCH /editCustomer', 1, 'PATCH', lambda: (f'/editCustomer/{work.randint(1, work.customers)}', {'email': 'edited@example.org'}), (200,)),
+        ('DELETE /deleteCustomer', 1, 'DELETE', lambda: (f'/deleteCustomer/{work.added_customer()}', None), (200, 404)),
+        ('POST /bulk/returnMovies', 1, 'POST', lambda: ('/bulk/returnMovies', {'rental_ids': [work.open_rental() for _ in range(20)]}), (200,)),
+        ('POST /bulk/addCustomers', 1, 'POST', lambda: ('/bulk/addCustomers', {'customers': [work.new_customer() for _ in range(100)]}), (200,)),
+        ('PATCH /bulk/editCustomers', 1, 'PATCH', lambda: ('/bulk/editCustomers', {'customers': [{'customer_id': customer_id, 'email': 'bulk@example.org'}
+                                                                                                for customer_id in work.sample(work.customers, 100)]}), (200,)),
+        ('POST /rebuildAvailability', 0, 'POST', lambda: ('/rebuildAvailability', None), (200,)),
+        ('POST /refreshSearchIndex', 0, 'POST', lambda: ('/refreshSearchIndex', None), (200,)),
+        ('POST /rebuildLeaderboards', 0, 'POST', lambda: ('/rebuildLeaderboards', None), (200,)),
+        ('POST /rebuildCustomerSummaries', 0, 'POST', lambda: ('/rebuildCustomerSummaries', None), (200,)),
+        ('POST /refreshAnalytics', 0, 'POST', lambda: ('/refreshAnalytics', None), (200,)),
+    ]
+
+# Current resident set size, or None where /proc is not available
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+# Highest RSS the process has ever reached. Used only when the current RSS cannot be read, so
+# there it is cumulative: a phase reports the peak of every phase before it as well.
+def max_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# Samples the RSS from a background thread while a phase runs and keeps the highest value seen
+class RSSSampler:
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self.done = threading.Event()
+        if self.peak is not None:
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.done.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc):
+        self.done.set()
+        if self.peak is None:
+            self.peak = max_rss_mb()
+        else:
+            self.thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+        return False
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[position]
+
+# Sends the requests from `concurrency` threads, each with its own test client.
+# Returns {endpoint name: [latencies]}, {endpoint name: unexpected statuses} and the wall time.
+def run_requests(app, work, requests, concurrency):
+    local = threading.local()
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def send(endpoint):
+        name, weight, method, build, accepted = endpoint
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        path, body = build()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        if name == 'POST /addRental':
+            work.rented(response)
+        elif name == 'POST /addCustomer':
+            work.added(response)
+        with lock:
+            latencies.setdefault(name, []).append(elapsed)
+            if response.status_code not in accepted:
+                errors[name] = errors.get(name, 0) + 1
+        response.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, requests))
+    return latencies, errors, time.perf_counter() - start
+
+def summarize(latencies, errors, wall_time):
+    report = {}
+    for name, values in latencies.items():
+        values = sorted(values)
+        report[name] = {
+            'requests': len(values),
+            'errors': errors.get(name, 0),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'throughput_rps': len(values) / wall_time if wall_time else 0.0,
+        }
+    return report
+
+# Returns the URL of a database holding the untouched dataset for this run, plus a directory to remove
+# afterwards. A SQLite dataset is generated once and copied for every run, so the file itself is never
+# written to. Any other database cannot be copied and is regenerated before every run instead.
+def prepare_database(args):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    url = args.database_url or f'sqlite:///{os.path.join(DATA_DIR, f"sakila_x{args.scale}.db")}'
+    path = make_url(url).database
+    if make_url(url).get_backend_name() != 'sqlite' or not path or path == ':memory:':
+        print(f'Regenerating the x{args.scale} dataset in {url} ...', flush=True)
+        dataset.generate(url, args.scale, args.seed)
+        return url, None
+
+    if args.regenerate or not dataset.is_pristine(url, args.scale):
+        print(f'Generating the x{args.scale} dataset in {url} ...', flush=True)
+        dataset.generate(url, args.scale, args.seed)
+    workdir = tempfile.mkdtemp(prefix='sakila_bench_')
+    copy = os.path.join(workdir, os.path.basename(path))
+    shutil.copyfile(path, copy)
+    return f'sqlite:///{copy}', workdir
+
+def run(args):
+    url, workdir = prepare_database(args)
+    try:
+        return run_benchmark(args, url)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def run_benchmark(args, url):
+    counts = dataset.row_counts(url)
+
+    # The app reads its database URL at import time
+    os.environ['DATABASE_URL'] = url
+    sys.path.insert(0, BACKEND)
+    import server
+    from sqlalchemy import text
+
+    with server.app.app_context():
+        customers = server.db.session.execute(text('SELECT COUNT(*) FROM customer')).scalar()
+        open_rentals = server.db.session.execute(text('SELECT rental_id FROM rental WHERE return_date IS NULL')).scalars().all()
+    work = Workload({'customers': customers}, open_rentals, args.seed)
+    workload = endpoints(work)
+
+    # Warm up lazily built state (search indexes, leaderboards, availability counts)
+    run_requests(server.app, work, [endpoint for endpoint in workload for _ in range(args.warmup)], 1)
+
+    report = {'scale': args.scale, 'dataset': counts, 'concurrency': args.concurrency, 'endpoints': {}, 'mix': {}}
+    for endpoint in workload:
+        with RSSSampler() as rss:
+            latencies, errors, wall_time = run_requests(server.app, work, [endpoint] * args.requests, args.concurrency)
+        report['endpoints'].update(summarize(latencies, errors, wall_time))
+        report['endpoints'][endpoint[0]]['peak_rss_mb'] = rss.peak
+
+    # Every endpoint at once, in proportion to its weight
+    mix = [endpoint for endpoint in workload for _ in range(endpoint[1])]
+    requests = [work.choice(mix) for _ in range(args.requests * len(workload))]
+    with RSSSampler() as rss:
+        latencies, errors, wall_time = run_requests(server.app, work, requests, args.concurrency)
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+    report['mix'] = summarize({'mix': all_latencies}, {'mix': sum(errors.values())}, wall_time)['mix']
+    report['mix']['peak_rss_mb'] = rss.peak
+    return report
+
+def print_report(report):
+    print(f"\nscale x{report['scale']}, concurrency {report['concurrency']}")
+    print(', '.join(f'{count} {name}' for name, count in report['dataset'].items()))
+    print(f"{'endpoint':34} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'peak MB':>8}")
+    rows = list(report['endpoints'].items()) + [('mix', report['mix'])]
+    for name, stats in rows:
+        print(f"{name:34} {stats['requests']:>6} {stats['errors']:>5} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['throughput_rps']:>9.1f} {stats['peak_rss_mb']:>8.1f}")
+
+# Returns a description of every endpoint whose p95 latency or throughput got worse than the tolerance allows
+def regressions(report, baseline, tolerance, min_delta_ms):
+    found = []
+    current = dict(report['endpoints'], mix=report['mix'])
+    previous = dict(baseline.get('endpoints', {}), mix=baseline.get('mix', {}))
+    for name, stats in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance) and stats['p95_ms'] - before['p95_ms'] > min_delta_ms:
+            found.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {stats['p95_ms']:.2f} ms")
+        if stats['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            found.append(f"{name}: throughput {before['throughput_rps']:.1f} -> {stats['throughput_rps']:.1f} req/s")
+        if stats['errors'] > before.get('errors', 0):
+            found.append(f"{name}: errors {before.get('errors', 0)} -> {stats['errors']}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route of the Flask app against a scaled Sakila dataset.')
+    parser.add_argument('--scale', type=int, default=1, help='dataset scale factor for rentals and customers (1, 10, 100)')
+    parser.add_argument('--database-url', help='database to benchmark against (default: a SQLite file under benchmarks/data)')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the dataset even if it already exists')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per endpoint before the run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--baseline', help='compare against this stored report and fail on regressions')
+    parser.add_argument('--save-baseline', help='store this run as the baseline at the given path')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown before a regression is reported')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore p95 increases smaller than this')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != report['scale']:
+            print(f"\nBaseline was recorded at scale x{baseline.get('scale')}, not x{report['scale']}")
+            return 2
+        if baseline.get('dataset') != report['dataset']:
+            print(f"\nBaseline was recorded on a different dataset ({baseline.get('dataset')}), not {report['dataset']}")
+            return 2
+        found = regressions(report, baseline, args.tolerance, args.min_delta_ms)
+        if found:
+            print('\nRegressions against the baseline:')
+            for line in found:
+                print(f'  {line}')
+            return 1
+        print('\nNo regressions against the baseline')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())